@@ -5,12 +5,15 @@
 
 import argparse
 import collections
+import concurrent.futures
 import datetime
 import email.utils
+import fnmatch
 import io
 import json
 import os
 import os.path
+import re
 import sys
 import lxml.etree
 
@@ -47,22 +50,62 @@ class Result(object):
         return self.css_class == 'verbose'
 
 
+class ResultRecord(object):
+    # picklable snapshot of Result, to pass results to render workers
+    def __init__(self, r):
+        for k in ('category', 'package', 'version', 'class', 'msg',
+                  'css_class'):
+            setattr(self, k, getattr(r, k))
+
+
 def result_sort_key(r):
     return (r.category, r.package, r.version, getattr(r, 'class'))
 
 
-def get_results(input_paths, class_mapping, excludes, verbose, pkg_filter):
+# (category, package) predicate matching package globs and/or
+# maintainers; the verdict is cached so metadata.xml is read only once
+# per package
+class PackageFilter(object):
+    def __init__(self, patterns=None, maints=None, maint_match=None):
+        self._pkg_re = None
+        if patterns is not None:
+            self._pkg_re = re.compile('|'.join(
+                fnmatch.translate(x) for x in patterns))
+        self._maints = maints
+        self._maint_match = maint_match
+        self._cache = {}
+
+    def __call__(self, cat, pkg):
+        k = (cat, pkg)
+        ret = self._cache.get(k)
+        if ret is None:
+            ret = self._cache[k] = self._match('/'.join(k))
+        return ret
+
+    def _match(self, key):
+        if self._pkg_re is not None and not self._pkg_re.match(key):
+            return False
+        if self._maint_match is not None:
+            return bool(self._maint_match.intersection(self._maints[key]))
+        return True
+
+
+def get_results(input_paths, class_mapping, excludes, verbose,
+                pkg_filter=None):
     mapper = ClassMapping(class_mapping, excludes)
     for input_path in input_paths:
         if input_path == '-':
             input_path = sys.stdin
         checks = lxml.etree.parse(input_path).getroot()
         for r in checks:
+            # filter on raw element to avoid wrapping skipped results
+            if (pkg_filter is not None
+                    and not pkg_filter(r.findtext('category') or '',
+                                       r.findtext('package') or '')):
+                continue
             r = Result(r, mapper)
             if r.verbose and not verbose:
                 continue
-            if not pkg_filter(r):
-                continue
             yield r
 
 
@@ -112,6 +155,34 @@ def find_of_class(it, cls, level = 2):
     return [(k, sorted(v)) for k, v in sorted(out.items())]
 
 
+_jinja_env = None
+
+
+def get_template(name):
+    global _jinja_env
+    if _jinja_env is None:
+        _jinja_env = jinja2.Environment(
+                loader=jinja2.FileSystemLoader(os.path.dirname(__file__)),
+                extensions=['jinja2htmlcompress.HTMLCompress'])
+    return _jinja_env.get_template(name)
+
+
+def render_result_group(args):
+    g, r, maints = args
+    t = get_template('output-group.html.jinja')
+    return t.render(g=g, r=deep_group(r, 2), maints=maints)
+
+
+def render_results(results, maints, jobs):
+    # render top-level (category) groups independently, in parallel
+    # if requested; fragments are concatenated in the original order
+    groups = [(g, r, maints) for g, r in group_results(results, 1)]
+    if jobs > 1 and len(groups) > 1:
+        with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+            return list(executor.map(render_result_group, groups))
+    return [render_result_group(x) for x in groups]
+
+
 def get_result_timestamp(paths):
     for p in paths:
         st = os.stat(p)
@@ -166,6 +237,8 @@ def main(*args):
     # target: https://pkgcheck.readthedocs.io/en/latest/man/pkgcheck.html
     p.add_argument('-d', '--doc-uri', default='https://bit.ly/2LJlamg',
             help='Documentation URI to use for help links')
+    p.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+            help='Number of processes to use for rendering')
     p.add_argument('-m', '--maintainer',
             help='Filter by maintainer (dev, dev@g.o or full e-mail address)')
     p.add_argument('-o', '--output', default='-',
@@ -173,7 +246,7 @@ def main(*args):
     p.add_argument('-p', '--projects', action='store_true',
             help='Recursively match projects whose member is maintainer')
     p.add_argument('-P', '--pkg',
-            help='Filter by package(s) (separated by `,`)')
+            help='Filter by package(s) (separated by `,`, globs allowed)')
     p.add_argument('-r', '--repo', default='/usr/portage',
             help='Repository path to get metadata.xml from')
     p.add_argument('-R', '--revision',
@@ -197,13 +270,11 @@ def main(*args):
         with open(args.excludes) as f:
             excludes = json.load(f)
 
-    jenv = jinja2.Environment(
-            loader=jinja2.FileSystemLoader(os.path.dirname(__file__)),
-            extensions=['jinja2htmlcompress.HTMLCompress'])
-    t = jenv.get_template('output.html.jinja')
+    t = get_template('output.html.jinja')
 
     maints = MaintainerGetter(args.repo)
-    maint_filter = lambda x: True
+    pkg_filter = None
+    maint_match = None
     if args.maintainer:
         if not '@' in args.maintainer:
             args.maintainer += '@gentoo.org'
@@ -218,21 +289,19 @@ def main(*args):
                 match.extend(
                         projects.find_projects_for_maintainer(args.maintainer))
 
-            match = frozenset([x.replace('@gentoo.org', '@g.o') for x in match])
+            maint_match = frozenset([x.replace('@gentoo.org', '@g.o')
+                                     for x in match])
         else:
-            match = frozenset(['maintainer-needed'])
-        maint_filter = lambda x: (bool(match.intersection(
-            maints['/'.join((x.category, x.package))])))
-    pkg_filter = lambda x: True
+            maint_match = frozenset(['maintainer-needed'])
+    packages = None
     if args.pkg:
-        packages = frozenset(args.pkg.split(','))
-        pkg_filter = lambda x: (bool(packages.intersection(
-            ['/'.join((x.category, x.package))])))
-
-    combined_filter = lambda x: maint_filter(x) and pkg_filter(x)
-    results = sorted(get_results(args.files, class_mapping, excludes,
-                                 args.verbose,
-                                 pkg_filter=combined_filter),
+        packages = args.pkg.split(',')
+    if packages is not None or maint_match is not None:
+        pkg_filter = PackageFilter(packages, maints, maint_match)
+
+    results = sorted((ResultRecord(r) for r in
+                      get_results(args.files, class_mapping, excludes,
+                                  args.verbose, pkg_filter=pkg_filter)),
                      key=result_sort_key)
 
     types = {}
@@ -248,7 +317,7 @@ def main(*args):
         ts = get_result_timestamp(args.files)
 
     out = t.render(
-        results=deep_group(results),
+        results=render_results(results, maints, args.jobs),
         warnings=find_of_class(results, 'warn'),
         staging=find_of_class(results, 'staging'),
         errors=find_of_class(results, 'err'),